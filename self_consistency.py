@@ -0,0 +1,195 @@
+import argparse
+import copy
+import csv
+import json
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from batch_prompts import BUCKET_NAME, REQUEST_TEMPLATE
+from result_to_csv import parse_jsonl_line
+
+
+def split_frame_name(frame: str) -> Tuple[str, int]:
+    """
+    Split a frame filename into its episode and its position in that episode.
+
+    Args:
+        frame (str): Frame filename, e.g. "06_Schilderij-87.jpg"
+
+    Returns:
+        Tuple[str, int]: Episode name and frame index, e.g. ("06_Schilderij", 87)
+    """
+    match = re.match(r'(.+)-(\d+)\.\w+$', frame)
+    if match:
+        return match.group(1), int(match.group(2))
+    return frame, 0
+
+
+def load_predictions(input_file: str) -> Dict[str, List[Tuple[bool, bool]]]:
+    """
+    Load all (pat, mat) labels from a predictions JSONL file, grouped by frame.
+
+    Args:
+        input_file (str): Path to a predictions JSONL file
+
+    Returns:
+        Dict[str, List[Tuple[bool, bool]]]: Every label that was returned per frame
+    """
+    labels = defaultdict(list)
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            result = parse_jsonl_line(line.strip())
+            if result:
+                labels[result['frame']].append((result['pat'], result['mat']))
+
+    return labels
+
+
+def select_disputed_frames(first_pass: Dict[str, List[Tuple[bool, bool]]], include_transitions: bool = False) -> List[str]:
+    """
+    Select frames whose label disagrees with their temporal neighbours in the same episode.
+
+    Args:
+        first_pass (Dict): Labels per frame from the first (single sample) pass
+        include_transitions (bool): Also select frames that disagree with only one neighbour,
+            i.e. both sides of every label change instead of just isolated outliers
+
+    Returns:
+        List[str]: Frames that should be re-queried
+    """
+    episodes = defaultdict(list)
+    for frame in first_pass:
+        episode, index = split_frame_name(frame)
+        episodes[episode].append((index, frame))
+
+    disputed = []
+
+    for episode in sorted(episodes.keys()):
+        frames = [frame for _, frame in sorted(episodes[episode])]
+
+        for i, frame in enumerate(frames):
+            label = first_pass[frame][0]
+            neighbours = [first_pass[frames[j]][0] for j in (i - 1, i + 1) if 0 <= j < len(frames)]
+            disagreeing = [n for n in neighbours if n != label]
+
+            if not disagreeing:
+                continue
+            if not include_transitions and len(disagreeing) < len(neighbours):
+                continue
+
+            disputed.append(frame)
+
+    return disputed
+
+
+def generate_vote_prompts(frames: List[str], votes: int, target_jsonl: str = "vote_prompts.jsonl"):
+    """
+    Write a follow-up shard that prompts every disputed frame `votes` times.
+
+    Args:
+        frames (List[str]): Frames to re-query
+        votes (int): Number of extra samples per frame
+        target_jsonl (str): Path to output JSONL file
+    """
+    lines = []
+
+    for frame in frames:
+        for vote in range(votes):
+            req = copy.deepcopy(REQUEST_TEMPLATE)
+            req["request"]["contents"][0]["parts"].append({
+                "fileData": {
+                    "mimeType": "image/jpeg",
+                    "fileUri": f"gs://{BUCKET_NAME}/{frame}"
+                }
+            })
+            req["request"]["labels"]["frame"] = frame
+            req["request"]["labels"]["vote"] = str(vote)
+
+            lines.append(json.dumps(req))
+
+    with open(target_jsonl, 'w') as f:
+        for line in lines:
+            f.write(f"{line}\n")
+
+    print(f"Wrote {len(lines)} JSON lines for {len(frames)} disputed frames to {target_jsonl}")
+
+
+def resolve_votes(first_pass: Dict[str, List[Tuple[bool, bool]]], vote_pass: Dict[str, List[Tuple[bool, bool]]]) -> List[Dict]:
+    """
+    Resolve the final label of every frame by majority vote.
+
+    The first pass sample counts as a vote as well, and wins any tie.
+
+    Args:
+        first_pass (Dict): Labels per frame from the first pass
+        vote_pass (Dict): Labels per frame from the follow-up voting shard
+
+    Returns:
+        List[Dict]: Rows with the frame, resolved pat/mat values, number of votes and vote margin
+    """
+    results = []
+
+    for frame, labels in first_pass.items():
+        first_label = labels[0]
+        counts = Counter([first_label] + vote_pass.get(frame, []))
+
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0] != first_label))
+        (pat, mat), top = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+
+        results.append({
+            'frame': frame,
+            'pat': pat,
+            'mat': mat,
+            'votes': sum(counts.values()),
+            'vote_margin': top - runner_up
+        })
+
+    return results
+
+
+def write_results(results: List[Dict], output_file: str):
+    """
+    Write resolved labels to a CSV file.
+
+    Args:
+        results (List[Dict]): Rows produced by resolve_votes
+        output_file (str): Path to output CSV file
+    """
+    fieldnames = ['frame', 'pat', 'mat', 'votes', 'vote_margin']
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
+
+    revoted = sum(1 for row in results if row['votes'] > 1)
+    print(f"Successfully resolved {len(results)} entries ({revoted} by vote) to {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-query frames that disagree with their neighbours and resolve labels by majority vote.')
+    parser.add_argument('first_pass', help='Predictions JSONL file from the first batch prediction pass')
+    parser.add_argument('--prepare', help='Write a voting shard for disputed frames to this JSONL file')
+    parser.add_argument('--votes', type=int, default=4, help='Number of extra samples per disputed frame (default: 4)')
+    parser.add_argument('--include-transitions', action='store_true', help='Also re-query frames that disagree with only one of their neighbours')
+    parser.add_argument('--resolve', nargs=2, metavar=('VOTES_JSONL', 'OUTPUT_CSV'), help='Resolve labels from the voting shard predictions into a CSV file')
+
+    args = parser.parse_args()
+
+    first_pass = load_predictions(args.first_pass)
+
+    if args.prepare:
+        disputed = select_disputed_frames(first_pass, args.include_transitions)
+        print(f"Found {len(disputed)} of {len(first_pass)} frames disagreeing with their neighbours")
+        generate_vote_prompts(disputed, args.votes, args.prepare)
+    elif args.resolve:
+        votes_file, output_file = args.resolve
+        write_results(resolve_votes(first_pass, load_predictions(votes_file)), output_file)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()